@@ -1,6 +1,8 @@
 from flask import Flask, render_template, request, redirect, url_for, flash, session, send_from_directory, jsonify
 from models import db, User
 from forms import RegistrationForm, LoginForm, ForgotPasswordForm, SecurityQuestionForm
+from heartbeat import heartbeats, parse_batch, HeartbeatError
+from stats import user_stats
 from datetime import datetime
 import os
 
@@ -9,12 +11,18 @@ app.secret_key = 'your-secure-secret-key-here'
 
 # Database configuration
 basedir = os.path.abspath(os.path.dirname(__file__))
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(basedir, "database.db")}'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', f'sqlite:///{os.path.join(basedir, "database.db")}')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # Initialize database
 db.init_app(app)
 
+# Gameplay heartbeats are aggregated in memory and flushed in batches
+heartbeats.init_app(app)
+
+# Dashboard statistics are maintained incrementally instead of counted per view
+user_stats.init_app(app)
+
 @app.route('/')
 def index():
     # Check if user is logged in
@@ -47,6 +55,7 @@ def register():
                 security_answer_2=form.security_answer_2.data.lower().strip()
             )
             db.session.add(user)
+            user_stats.user_registered(user)
             db.session.commit()
             flash(f'Account created successfully! Welcome, {user.username}! Please log in to continue. 🚀', 'success')
             return redirect(url_for('index'))
@@ -140,6 +149,16 @@ def game():
     # Serve the WebGL Earth game directly
     return render_template('game.html')
 
+@app.route('/dashboard')
+def dashboard():
+    # Check if user is logged in
+    if 'user_id' not in session:
+        flash('Please log in to access the dashboard.', 'error')
+        return redirect(url_for('index'))
+    
+    stats = user_stats.get()
+    return render_template('dashboard.html', total_users=stats['total_users'], stats=stats)
+
 @app.route('/save_score', methods=['POST'])
 def save_score():
     # Check if user is logged in
@@ -147,10 +166,19 @@ def save_score():
         return {'success': False, 'error': 'Not logged in'}, 401
     
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return {'success': False, 'error': 'Invalid payload'}, 400
         score = data.get('score', 0)
         level = data.get('level', 1)
         
+        # Only plain integers are accepted; bool is a subclass of int
+        for value in (score, level):
+            if not isinstance(value, int) or isinstance(value, bool):
+                return {'success': False, 'error': 'Score and level must be integers'}, 400
+        if score < 0 or level < 1:
+            return {'success': False, 'error': 'Score or level out of range'}, 400
+        
         # Get current user
         user = User.query.get(session['user_id'])
         if not user:
@@ -158,8 +186,10 @@ def save_score():
         
         # Update user's score if it's higher than current
         if score > user.score:
+            old_score, old_level = user.score, user.level
             user.score = score
             user.level = max(user.level, level)
+            user_stats.score_changed(user, old_score, old_level)
             db.session.commit()
             
             return {'success': True, 'message': 'Score saved successfully', 'new_high_score': True}
@@ -170,6 +200,21 @@ def save_score():
         db.session.rollback()
         return {'success': False, 'error': str(e)}, 500
 
+@app.route('/heartbeat', methods=['POST'])
+def heartbeat():
+    # Check if user is logged in
+    if 'user_id' not in session:
+        return {'success': False, 'error': 'Not logged in'}, 401
+    
+    try:
+        batch_id, seconds, xp = parse_batch(request.get_json(silent=True))
+    except HeartbeatError as e:
+        return {'success': False, 'error': str(e)}, 400
+    
+    # Retried batches are acknowledged but not counted twice
+    accepted = heartbeats.record(session['user_id'], batch_id, seconds, xp)
+    return {'success': True, 'duplicate': not accepted}
+
 @app.route('/logout')
 def logout():
     session.clear()
@@ -0,0 +1,51 @@
+import os
+import tempfile
+
+import pytest
+
+# Point the app at a scratch database before it is imported
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db')
+
+import app as app_module
+from heartbeat import HeartbeatAggregator
+from models import db, User
+from stats import UserStats
+
+# test_simple.py is a pygame demo, not a test module
+collect_ignore = ['test_simple.py']
+
+
+def make_user(username, score=0):
+    return User(
+        username=username, password='secret', score=score, level=1,
+        security_question_1='q1', security_answer_1='a1',
+        security_question_2='q2', security_answer_2='a2',
+    )
+
+
+@pytest.fixture
+def app():
+    app = app_module.app
+    with app.app_context():
+        db.create_all()
+        # A user that existed before any counters or heartbeats
+        db.session.add(make_user('pioneer', score=50))
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app, monkeypatch):
+    # Fresh aggregator and stats per test; flushes are run by the test instead of a thread
+    heartbeats = HeartbeatAggregator(app)
+    monkeypatch.setattr(heartbeats, '_ensure_started', lambda: None)
+    monkeypatch.setattr(app_module, 'heartbeats', heartbeats)
+    monkeypatch.setattr(app_module, 'user_stats', UserStats())
+    return app.test_client()
+
+
+def log_in(client, user_id=1):
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
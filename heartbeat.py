@@ -0,0 +1,266 @@
+"""
+Batched gameplay heartbeat ingestion.
+
+The game page collects activity records on the client and posts them in
+batches to /heartbeat. Batches are held in memory and a background
+thread periodically sums them per user and writes the totals to the
+database in a single transaction, so the database sees one commit per
+flush instead of one commit per request.
+"""
+
+import atexit
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, User, HeartbeatBatch, PlaytimeRemainder
+
+# How often pending heartbeats are written to the database (seconds)
+FLUSH_INTERVAL = 15
+# Flush early once this many batches are waiting
+FLUSH_THRESHOLD = 500
+# Batches are dropped after this many failed flushes
+MAX_FLUSH_ATTEMPTS = 3
+
+# Sanity limits for client supplied records. The game page splits its
+# records to stay within these, so larger values are rejected rather than clamped.
+MAX_RECORDS_PER_BATCH = 120
+MAX_SECONDS_PER_RECORD = 300
+MAX_XP_PER_RECORD = 1000
+MAX_BATCH_ID_LENGTH = 64
+
+# Applied batch ids are remembered in memory and in the database for this long
+IDEMPOTENCY_WINDOW = timedelta(days=1)
+RECENT_KEYS_LIMIT = 50000
+
+
+class HeartbeatError(ValueError):
+    """Raised when a heartbeat batch is malformed"""
+
+
+def parse_batch(data):
+    """Validate a heartbeat payload and return (batch_id, seconds, xp)"""
+    if not isinstance(data, dict):
+        raise HeartbeatError('Invalid payload')
+
+    batch_id = data.get('batch_id')
+    if not isinstance(batch_id, str) or not batch_id or len(batch_id) > MAX_BATCH_ID_LENGTH:
+        raise HeartbeatError('Missing or invalid batch_id')
+
+    records = data.get('records')
+    if not isinstance(records, list) or len(records) > MAX_RECORDS_PER_BATCH:
+        raise HeartbeatError('Missing or invalid records')
+
+    seconds = 0
+    xp = 0
+    for record in records:
+        if not isinstance(record, dict):
+            raise HeartbeatError('Invalid record')
+        record_seconds = record.get('seconds', 0)
+        record_xp = record.get('xp', 0)
+        # bool is a subclass of int, reject it explicitly
+        for value in (record_seconds, record_xp):
+            if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+                raise HeartbeatError('Record values must be non-negative integers')
+        if record_seconds > MAX_SECONDS_PER_RECORD or record_xp > MAX_XP_PER_RECORD:
+            raise HeartbeatError('Record values exceed the per-record limit')
+        seconds += record_seconds
+        xp += record_xp
+
+    return batch_id, seconds, xp
+
+
+class HeartbeatAggregator:
+    """Collects heartbeat batches and flushes per-user totals periodically"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+        # key -> [user_id, seconds, xp, failed_flushes] waiting to be flushed.
+        # Batches stay separate until the flush so a duplicate key only drops its own batch.
+        self._pending = {}
+        # Keys of the flush in progress
+        self._inflight_keys = set()
+        # Recently flushed keys, oldest first, so retries are answered from memory
+        self._recent_keys = OrderedDict()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['heartbeat'] = self
+
+    @staticmethod
+    def make_key(user_id, batch_id):
+        return f'{user_id}:{batch_id}'
+
+    def _is_known(self, key):
+        return key in self._pending or key in self._inflight_keys or key in self._recent_keys
+
+    def record(self, user_id, batch_id, seconds, xp):
+        """Queue a batch for a user. Returns False if this process has already seen it.
+
+        Batches applied by another process or before a restart are not looked
+        up here; the flush skips any key that is already in the database.
+        """
+        key = self.make_key(user_id, batch_id)
+
+        with self._lock:
+            if self._is_known(key):
+                return False
+            self._pending[key] = [user_id, seconds, xp, 0]
+            backlog = len(self._pending)
+
+        self._ensure_started()
+        if backlog >= FLUSH_THRESHOLD:
+            self._wakeup.set()
+        return True
+
+    def _remember(self, key):
+        self._recent_keys[key] = True
+        self._recent_keys.move_to_end(key)
+        while len(self._recent_keys) > RECENT_KEYS_LIMIT:
+            self._recent_keys.popitem(last=False)
+
+    def flush(self):
+        """Write pending totals, in one transaction unless a batch fails. Must run in an app context."""
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self):
+        with self._lock:
+            if not self._pending:
+                return 0
+            batches, self._pending = self._pending, {}
+            self._inflight_keys = set(batches)
+
+        now = datetime.utcnow()
+        failed = {}
+        try:
+            applied = self._commit(batches, now)
+        except Exception:
+            # Retry one batch at a time so a bad batch does not take the others with it
+            applied = 0
+            for key, batch in batches.items():
+                try:
+                    applied += self._commit({key: batch}, now)
+                except Exception as e:
+                    failed[key] = batch
+                    error = e
+
+        dropped = 0
+        with self._lock:
+            self._inflight_keys = set()
+            for key in batches:
+                if key not in failed:
+                    self._remember(key)
+            # Retry a few times, then give up on the batch instead of piling it up
+            for key, batch in failed.items():
+                batch[3] += 1
+                if batch[3] < MAX_FLUSH_ATTEMPTS:
+                    self._pending[key] = batch
+                else:
+                    dropped += 1
+
+        if failed and self.app is not None:
+            self.app.logger.error(
+                f'Heartbeat flush failed for {len(failed)} batches, dropped {dropped}: {error}'
+            )
+        return applied
+
+    def _commit(self, batches, now):
+        try:
+            applied = self._apply(batches, now)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return applied
+
+    def _apply(self, batches, now):
+        """Record batch keys and add the new batches to user totals. Returns the number applied."""
+        # Keys already in the database were applied by another process or before a restart
+        insert_key = sqlite_insert(HeartbeatBatch.__table__).on_conflict_do_nothing(index_elements=['key'])
+        totals = {}
+        applied = 0
+        for key, (user_id, seconds, xp, _) in batches.items():
+            result = db.session.execute(insert_key.values(key=key, user_id=user_id, received_at=now))
+            if result.rowcount:
+                applied += 1
+                user_totals = totals.setdefault(user_id, [0, 0])
+                user_totals[0] += seconds
+                user_totals[1] += xp
+
+        if totals:
+            # Seconds short of a whole minute are carried over in the database
+            remainders = dict(
+                db.session.query(PlaytimeRemainder.user_id, PlaytimeRemainder.seconds)
+                .filter(PlaytimeRemainder.user_id.in_(list(totals)))
+            )
+            user_rows = []
+            remainder_rows = []
+            for user_id, (seconds, xp) in totals.items():
+                minutes, remainder = divmod(seconds + remainders.get(user_id, 0), 60)
+                user_rows.append({'uid': user_id, 'minutes': minutes, 'xp': xp})
+                remainder_rows.append({'user_id': user_id, 'seconds': remainder})
+
+            table = User.__table__
+            db.session.execute(
+                table.update()
+                .where(table.c.id == bindparam('uid'))
+                .values(
+                    total_playtime=table.c.total_playtime + bindparam('minutes'),
+                    experience_points=table.c.experience_points + bindparam('xp'),
+                ),
+                user_rows,
+            )
+
+            upsert = sqlite_insert(PlaytimeRemainder.__table__)
+            upsert = upsert.on_conflict_do_update(
+                index_elements=['user_id'], set_={'seconds': upsert.excluded.seconds}
+            )
+            db.session.execute(upsert, remainder_rows)
+
+        db.session.execute(
+            HeartbeatBatch.__table__.delete().where(
+                HeartbeatBatch.__table__.c.received_at < now - IDEMPOTENCY_WINDOW
+            )
+        )
+        return applied
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='heartbeat-flush', daemon=True)
+            self._thread.start()
+        atexit.register(self._flush_at_exit)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(FLUSH_INTERVAL)
+            self._wakeup.clear()
+            self._flush_in_context()
+
+    def _flush_in_context(self):
+        with self.app.app_context():
+            try:
+                self.flush()
+            except Exception as e:
+                self.app.logger.error(f'Heartbeat flush failed: {e}')
+
+    def _flush_at_exit(self):
+        self._flush_in_context()
+
+
+heartbeats = HeartbeatAggregator()
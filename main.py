@@ -2,6 +2,7 @@ import asyncio
 import pygame
 import math
 import random
+import numpy as np
 
 # Initialize pygame
 pygame.init()
@@ -177,53 +178,129 @@ def draw_earth_continents(surface, center, radius, rotation_angle=0):
         # Fallback to simple circle if image loading fails
         pygame.draw.circle(surface, OCEAN_BLUE, center, radius)
 
+# Pre-baked cloud and atmosphere layers, keyed by kind and size
+layer_cache = {}
+
+CLOUD_SEED = 2024
+CLOUD_COVERAGE = 0.5  # Noise level below which the sky is clear
+CLOUD_MAX_ALPHA = 200
+ATMOSPHERE_THICKNESS = 24
+ATMOSPHERE_MAX_ALPHA = 90
+
+def get_cached_layer(key, factory):
+    """Return the layer stored under key, building it once with factory"""
+    layer = layer_cache.get(key)
+    if layer is None:
+        layer = factory()
+        layer_cache[key] = layer
+    return layer
+
+def alpha_surface(color, alpha):
+    """Create a surface of a single color with per-pixel alpha from a (height, width) array"""
+    height, width = alpha.shape
+    layer = pygame.Surface((width, height), pygame.SRCALPHA)
+    layer.fill((*color[:3], 0))
+    # surfarray indexes pixels as [x, y]
+    pixels = pygame.surfarray.pixels_alpha(layer)
+    pixels[:] = np.clip(alpha, 0, 255).astype(np.uint8).T
+    del pixels  # Unlock the surface
+    return layer.convert_alpha()
+
+def tileable_value_noise(width, height, cells_x, cells_y, rng):
+    """Smooth value noise that wraps around horizontally"""
+    lattice = rng.random((cells_y + 1, cells_x))
+    
+    xs = np.arange(width) * cells_x / width
+    ys = np.arange(height) * cells_y / height
+    x0 = xs.astype(int)
+    y0 = ys.astype(int)
+    x1 = (x0 + 1) % cells_x  # Wrap so the left and right edges meet
+    y1 = y0 + 1
+    
+    # Smoothstep weights avoid visible lattice lines
+    tx = xs - x0
+    ty = (ys - y0)[:, None]
+    tx = tx * tx * (3 - 2 * tx)
+    ty = ty * ty * (3 - 2 * ty)
+    
+    top = lattice[y0][:, x0] * (1 - tx) + lattice[y0][:, x1] * tx
+    bottom = lattice[y1][:, x0] * (1 - tx) + lattice[y1][:, x1] * tx
+    return top * (1 - ty) + bottom * ty
+
+def generate_cloud_texture(width, height, seed=CLOUD_SEED, octaves=5):
+    """Generate a horizontally seamless cloud texture from layered noise"""
+    rng = np.random.default_rng(seed)
+    noise = np.zeros((height, width))
+    amplitude = 1.0
+    total_amplitude = 0.0
+    cells_x, cells_y = 6, 3
+    
+    for _ in range(octaves):
+        noise += amplitude * tileable_value_noise(width, height, cells_x, cells_y, rng)
+        total_amplitude += amplitude
+        amplitude *= 0.5
+        cells_x *= 2
+        cells_y *= 2
+    noise /= total_amplitude
+    
+    # Keep only the denser parts of the noise as clouds
+    density = np.clip((noise - CLOUD_COVERAGE) / (1 - CLOUD_COVERAGE), 0, 1)
+    return alpha_surface(CLOUD_WHITE, np.sqrt(density) * CLOUD_MAX_ALPHA)
+
+def radial_distance(size, center):
+    """Distance of every pixel in a size x size grid from center"""
+    ys, xs = np.ogrid[:size, :size]
+    return np.hypot(xs + 0.5 - center, ys + 0.5 - center)
+
+def generate_cloud_mask(radius):
+    """Generate the Earth disc mask, fading clouds towards the limb"""
+    distance = radial_distance(radius * 2, radius) / radius
+    fade = np.sqrt(np.clip(1 - distance * distance, 0, 1)) ** 0.5
+    return alpha_surface((255, 255, 255), fade * 255)
+
+def generate_atmosphere_halo(radius, thickness=ATMOSPHERE_THICKNESS):
+    """Generate a radial-gradient glow around the Earth's edge"""
+    outer_radius = radius + thickness
+    distance = radial_distance(outer_radius * 2, outer_radius)
+    
+    # Outside the planet the glow falls off towards the edge of the halo
+    height_above = (distance - radius) / thickness
+    outside = np.exp(-3 * height_above) * np.clip(1 - height_above, 0, 1)
+    # Inside the planet a thin rim brightens the limb
+    inside = (np.clip(distance, 0, radius) / radius) ** 12
+    
+    glow = np.where(distance >= radius, outside, inside)
+    return alpha_surface(ATMOSPHERE_BLUE, glow * ATMOSPHERE_MAX_ALPHA)
+
 def draw_atmosphere(surface, center, radius):
     """Draw atmospheric glow around Earth"""
-    # Reduced layers for faster rendering
-    for i in range(3):  # Reduced from 5 to 3 layers
-        glow_radius = radius + (i * 10)
-        alpha = max(15, 60 - (i * 15))
-        
-        # Create a surface for the glow layer
-        glow_surface = pygame.Surface((glow_radius * 2, glow_radius * 2), pygame.SRCALPHA)
-        glow_color = (*ATMOSPHERE_BLUE[:3], alpha)
-        
-        pygame.draw.circle(glow_surface, glow_color, (glow_radius, glow_radius), glow_radius)
-        pygame.draw.circle(glow_surface, (0, 0, 0, 255), (glow_radius, glow_radius), radius)
-        
-        glow_rect = glow_surface.get_rect(center=center)
-        surface.blit(glow_surface, glow_rect, special_flags=pygame.BLEND_ALPHA_SDL2)
+    halo = get_cached_layer(('atmosphere', radius), lambda: generate_atmosphere_halo(radius))
+    surface.blit(halo, halo.get_rect(center=center))
 
 def draw_clouds(surface, center, radius, cloud_rotation=0):
     """Draw cloud patterns on Earth"""
-    cloud_surface = pygame.Surface((radius * 2, radius * 2), pygame.SRCALPHA)
+    diameter = radius * 2
+    # One full rotation scrolls exactly one texture width
+    texture_width = max(diameter, round(2 * math.pi * radius))
     
-    # Fewer cloud patches for faster rendering
-    cloud_patches = [
-        (0.2, 0.3, 0.15), (0.7, 0.2, 0.12), (0.4, 0.6, 0.18),
-        (0.8, 0.5, 0.1), (0.1, 0.7, 0.13), (0.6, 0.8, 0.11)
-    ]
+    texture = get_cached_layer(('clouds', radius), lambda: generate_cloud_texture(texture_width, diameter))
+    mask = get_cached_layer(('cloud_mask', radius), lambda: generate_cloud_mask(radius))
+    cloud_surface = get_cached_layer(
+        ('cloud_surface', radius), lambda: pygame.Surface((diameter, diameter), pygame.SRCALPHA)
+    )
     
-    for rel_x, rel_y, cloud_size in cloud_patches:
-        # Convert to actual coordinates with rotation
-        x = (rel_x - 0.5) * radius * 1.6
-        y = (rel_y - 0.5) * radius * 1.6
-        
-        # Apply cloud rotation (slightly different from Earth rotation)
-        rotated_x = x * math.cos(cloud_rotation) - y * math.sin(cloud_rotation)
-        rotated_y = x * math.sin(cloud_rotation) + y * math.cos(cloud_rotation)
-        
-        final_x = rotated_x + radius
-        final_y = rotated_y + radius
-        
-        # Only draw clouds that are visible
-        if (rotated_x ** 2 + rotated_y ** 2) <= (radius ** 2):
-            cloud_radius = int(cloud_size * radius)
-            pygame.draw.circle(cloud_surface, CLOUD_WHITE, (int(final_x), int(final_y)), cloud_radius)
+    # Copy the visible window of the texture, wrapping around its right edge
+    offset = int(cloud_rotation * radius) % texture_width
+    first_width = min(diameter, texture_width - offset)
+    cloud_surface.fill((0, 0, 0, 0))
+    cloud_surface.blit(texture, (0, 0), pygame.Rect(offset, 0, first_width, diameter), special_flags=pygame.BLEND_RGBA_MAX)
+    if first_width < diameter:
+        cloud_surface.blit(texture, (first_width, 0), pygame.Rect(0, 0, diameter - first_width, diameter), special_flags=pygame.BLEND_RGBA_MAX)
+    
+    # Clip to the Earth disc
+    cloud_surface.blit(mask, (0, 0), special_flags=pygame.BLEND_RGBA_MULT)
     
-    # Blit clouds to main surface
-    cloud_rect = cloud_surface.get_rect(center=center)
-    surface.blit(cloud_surface, cloud_rect, special_flags=pygame.BLEND_ALPHA_SDL2)
+    surface.blit(cloud_surface, cloud_surface.get_rect(center=center))
 
 async def main():
     # Main game loop variables
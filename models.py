@@ -26,3 +26,31 @@ class User(db.Model):
     
     def __repr__(self):
         return f'<User {self.username}>'
+
+
+class HeartbeatBatch(db.Model):
+    """Idempotency key for a gameplay heartbeat batch that has been applied"""
+    key = db.Column(db.String(160), primary_key=True)  # "<user_id>:<batch_id>"
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<HeartbeatBatch {self.key}>'
+
+
+class StatCounter(db.Model):
+    """Maintained aggregate counter used for dashboard statistics"""
+    name = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.Integer, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f'<StatCounter {self.name}={self.value}>'
+
+
+class PlaytimeRemainder(db.Model):
+    """Heartbeat seconds not yet credited to total_playtime, which is kept in whole minutes"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    seconds = db.Column(db.Integer, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f'<PlaytimeRemainder {self.user_id}={self.seconds}s>'
@@ -0,0 +1,263 @@
+"""
+Maintained aggregate statistics for the dashboard.
+
+Counters (total users, active users, score sum and max, users per level)
+are kept in the StatCounter table and updated incrementally in the same
+transaction as the user change that caused them, so the dashboard never
+has to scan the User table. Each process caches the small counter table
+in memory and reloads it after one of its own counter changes commits,
+or once it is older than RELOAD_INTERVAL so changes from other processes
+and from `reconcile()` show up. `reconcile()` recomputes everything from
+scratch and reports any drift.
+"""
+
+import threading
+import time
+
+from sqlalchemy import case, event, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, User, StatCounter
+
+TOTAL_USERS = 'total_users'
+ACTIVE_USERS = 'active_users'
+SCORE_SUM = 'score_sum'
+SCORE_MAX = 'score_max'
+LEVEL_PREFIX = 'level:'
+
+# Seconds before the cached counters are reloaded from the database
+RELOAD_INTERVAL = 30
+
+# session.info keys marking a transaction that seeded or changed the counters
+_SEEDED_KEY = 'stat_counters_seeded'
+_STAGED_KEY = 'stat_counters_changed'
+
+
+def level_counter(level):
+    return f'{LEVEL_PREFIX}{level}'
+
+
+class UserStats:
+    """Incrementally maintained user statistics served from memory"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._lock = threading.Lock()
+        # name -> value, cached from the StatCounter table
+        self._counters = None
+        # Bumped whenever a counter change commits; the cache is only
+        # valid for the version it was loaded under
+        self._version = 0
+        self._loaded_version = -1
+        self._loaded_at = 0.0
+        # Set once the counter rows are known to exist
+        self._seeded = False
+
+        event.listen(db.session, 'after_commit', self._after_commit)
+        event.listen(db.session, 'after_transaction_end', self._after_transaction_end)
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['user_stats'] = self
+
+        @app.cli.command('reconcile-stats')
+        def reconcile_stats_command():
+            """Recompute dashboard statistics and report drift."""
+            drift = self.reconcile()
+            if not drift:
+                print('Statistics are consistent.')
+            for name, (stored, actual) in sorted(drift.items()):
+                print(f'{name}: stored {stored}, actual {actual}')
+
+    # Hooks called before the session is committed
+
+    def user_registered(self, user):
+        """Count a newly added user"""
+        # Flush so column defaults are applied, after seeding so the seed does not count the user
+        self._ensure_seeded()
+        db.session.flush()
+        self._stage(
+            {
+                TOTAL_USERS: 1,
+                ACTIVE_USERS: 1 if user.is_active else 0,
+                SCORE_SUM: user.score,
+                level_counter(user.level): 1,
+            },
+            {SCORE_MAX: user.score},
+        )
+
+    def score_changed(self, user, old_score, old_level):
+        """Account for a change to a user's score and level"""
+        deltas = {SCORE_SUM: user.score - old_score}
+        if user.level != old_level:
+            deltas[level_counter(old_level)] = -1
+            deltas[level_counter(user.level)] = 1
+        # Scores only ever go up; reconcile() corrects the max otherwise
+        self._stage(deltas, {SCORE_MAX: user.score})
+
+    def set_active(self, user, active):
+        """Activate or deactivate a user and update the active count.
+
+        Use this instead of assigning user.is_active directly.
+        """
+        if user.is_active == active:
+            return
+        user.is_active = active
+        self._stage({ACTIVE_USERS: 1 if active else -1})
+
+    def _stage(self, deltas, maxima=None):
+        self._ensure_seeded()
+
+        deltas = {name: delta for name, delta in deltas.items() if delta}
+        maxima = maxima or {}
+        table = StatCounter.__table__
+
+        for name, delta in deltas.items():
+            result = db.session.execute(
+                table.update().where(table.c.name == name).values(value=table.c.value + delta)
+            )
+            # Only level counters can be missing once seeded, meaning no users at that level yet
+            if result.rowcount == 0:
+                db.session.execute(table.insert().values(name=name, value=delta))
+
+        for name, value in maxima.items():
+            db.session.execute(
+                table.update()
+                .where(table.c.name == name)
+                .values(value=case((table.c.value < value, value), else_=table.c.value))
+            )
+
+        db.session.info[_STAGED_KEY] = True
+
+    def _ensure_seeded(self):
+        """Create the counter rows from the User table if they do not exist yet"""
+        if self._seeded or db.session.info.get(_SEEDED_KEY):
+            return
+        # Count the users as they are in the database, before the pending change
+        with db.session.no_autoflush:
+            if db.session.get(StatCounter, TOTAL_USERS) is not None:
+                self._seeded = True
+                return
+            counters = self.compute()
+        # Another process may seed at the same time; its values are equally valid
+        db.session.execute(
+            sqlite_insert(StatCounter.__table__).on_conflict_do_nothing(index_elements=['name']),
+            [{'name': name, 'value': value} for name, value in counters.items()],
+        )
+        # The seed only counts once this transaction commits
+        db.session.info[_SEEDED_KEY] = True
+
+    def _after_commit(self, session):
+        if session.info.pop(_SEEDED_KEY, None):
+            self._seeded = True
+        if session.info.pop(_STAGED_KEY, None):
+            with self._lock:
+                self._version += 1
+
+    def _after_transaction_end(self, session, transaction):
+        # A rolled back transaction changed nothing
+        if transaction.parent is None:
+            session.info.pop(_SEEDED_KEY, None)
+            session.info.pop(_STAGED_KEY, None)
+
+    # Reading
+
+    def _load(self):
+        """Return the cached counters, reloading them if they are stale"""
+        with self._lock:
+            if (
+                self._counters is not None
+                and self._loaded_version == self._version
+                and time.monotonic() - self._loaded_at < RELOAD_INTERVAL
+            ):
+                return dict(self._counters)
+            version = self._version
+
+        rows = StatCounter.query.all()
+        if not rows:
+            self.reconcile()
+            rows = StatCounter.query.all()
+        counters = {row.name: row.value for row in rows}
+
+        with self._lock:
+            # A change that committed while reading may be missing, so only
+            # cache what was read if nothing committed in the meantime
+            if self._version == version:
+                self._counters = counters
+                self._loaded_version = version
+                self._loaded_at = time.monotonic()
+        return dict(counters)
+
+    def get(self):
+        """Return the current statistics. Must run in an app context."""
+        counters = self._load()
+
+        total = counters.get(TOTAL_USERS, 0)
+        users_per_level = {}
+        for name, value in counters.items():
+            if not name.startswith(LEVEL_PREFIX) or not value:
+                continue
+            try:
+                level = int(name[len(LEVEL_PREFIX):])
+            except ValueError:
+                # Left behind by a non-integer level stored before levels were validated
+                continue
+            users_per_level[level] = value
+
+        return {
+            'total_users': total,
+            'active_users': counters.get(ACTIVE_USERS, 0),
+            'average_score': round(counters.get(SCORE_SUM, 0) / total, 1) if total else 0,
+            'max_score': counters.get(SCORE_MAX, 0),
+            'users_per_level': dict(sorted(users_per_level.items())),
+        }
+
+    # Reconciliation
+
+    def compute(self):
+        """Compute all counters from the User table"""
+        total, active, score_sum, score_max = db.session.query(
+            func.count(User.id),
+            func.coalesce(func.sum(case((User.is_active, 1), else_=0)), 0),
+            func.coalesce(func.sum(User.score), 0),
+            func.coalesce(func.max(User.score), 0),
+        ).one()
+
+        counters = {
+            TOTAL_USERS: total,
+            ACTIVE_USERS: active,
+            SCORE_SUM: score_sum,
+            SCORE_MAX: score_max,
+        }
+        for level, count in db.session.query(User.level, func.count(User.id)).group_by(User.level):
+            counters[level_counter(level)] = count
+        return counters
+
+    def reconcile(self):
+        """Rebuild the counters from scratch and return {name: (stored, actual)} for any drift"""
+        actual = self.compute()
+        stored = {row.name: row.value for row in StatCounter.query.all()}
+
+        drift = {}
+        for name in set(actual) | set(stored):
+            if stored.get(name, 0) != actual.get(name, 0):
+                drift[name] = (stored.get(name), actual.get(name, 0))
+
+        if drift or set(stored) != set(actual):
+            StatCounter.query.delete()
+            db.session.add_all(StatCounter(name=name, value=value) for name, value in actual.items())
+        db.session.commit()
+
+        with self._lock:
+            self._seeded = True
+            self._version += 1
+
+        if drift and self.app is not None:
+            self.app.logger.warning(f'Statistics drift corrected: {drift}')
+        return drift
+
+
+user_stats = UserStats()
@@ -0,0 +1,89 @@
+import pytest
+
+from conftest import log_in
+from heartbeat import HeartbeatAggregator, parse_batch, HeartbeatError, MAX_FLUSH_ATTEMPTS, MAX_XP_PER_RECORD
+from models import db, User, HeartbeatBatch, PlaytimeRemainder
+
+
+def new_aggregator(app):
+    heartbeats = HeartbeatAggregator(app)
+    heartbeats._ensure_started = lambda: None
+    return heartbeats
+
+
+def test_parse_batch_rejects_bad_records():
+    assert parse_batch({'batch_id': 'b1', 'records': [{'seconds': 30, 'xp': 5}]}) == ('b1', 30, 5)
+    with pytest.raises(HeartbeatError):
+        parse_batch({'batch_id': 'b1', 'records': [{'seconds': -1}]})
+    # Values over the limit are rejected, not silently clamped
+    with pytest.raises(HeartbeatError):
+        parse_batch({'batch_id': 'b1', 'records': [{'xp': MAX_XP_PER_RECORD + 1}]})
+
+
+def test_retried_batch_is_counted_once(app):
+    heartbeats = new_aggregator(app)
+    assert heartbeats.record(1, 'b1', 90, 10)
+    assert not heartbeats.record(1, 'b1', 90, 10)
+    assert heartbeats.flush() == 1
+    assert not heartbeats.record(1, 'b1', 90, 10)
+
+    user = db.session.get(User, 1)
+    assert (user.total_playtime, user.experience_points) == (1, 10)
+    assert db.session.get(PlaytimeRemainder, 1).seconds == 30
+
+
+def test_batch_applied_elsewhere_is_skipped(app):
+    # Another process already applied this batch
+    db.session.add(HeartbeatBatch(key='1:b1', user_id=1))
+    db.session.commit()
+
+    heartbeats = new_aggregator(app)
+    heartbeats.record(1, 'b1', 120, 10)
+    heartbeats.record(1, 'b2', 40, 5)
+    assert heartbeats.flush() == 1
+
+    user = db.session.get(User, 1)
+    assert (user.total_playtime, user.experience_points) == (0, 5)
+    heartbeats.record(1, 'b3', 20, 0)
+    heartbeats.flush()
+    db.session.refresh(user)
+    assert user.total_playtime == 1
+
+
+def test_failing_batch_does_not_drop_the_others(app, monkeypatch):
+    heartbeats = new_aggregator(app)
+    heartbeats.record(1, 'good', 0, 10)
+    heartbeats.record(1, 'bad', 0, 20)
+    apply = heartbeats._apply
+
+    def fail_on_bad(batches, now):
+        if '1:bad' in batches:
+            raise RuntimeError('bad batch')
+        return apply(batches, now)
+
+    monkeypatch.setattr(heartbeats, '_apply', fail_on_bad)
+    assert heartbeats.flush() == 1
+    for _ in range(MAX_FLUSH_ATTEMPTS - 1):
+        assert heartbeats.flush() == 0
+    # The bad batch has been dropped
+    assert not heartbeats._pending
+    assert db.session.get(User, 1).experience_points == 10
+
+
+def test_heartbeat_requires_login(client):
+    response = client.post('/heartbeat', json={'batch_id': 'b1', 'records': []})
+    assert response.status_code == 401
+
+
+def test_heartbeat_rejects_malformed_body(client):
+    log_in(client)
+    assert client.post('/heartbeat', data='not json').status_code == 400
+    response = client.post('/heartbeat', json={'batch_id': 'b1', 'records': [{'seconds': 'ten'}]})
+    assert response.status_code == 400
+
+
+def test_heartbeat_reports_duplicate_batch(client):
+    log_in(client)
+    batch = {'batch_id': 'b1', 'records': [{'seconds': 30, 'xp': 10}]}
+    assert client.post('/heartbeat', json=batch).json == {'success': True, 'duplicate': False}
+    assert client.post('/heartbeat', json=batch).json == {'success': True, 'duplicate': True}
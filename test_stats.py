@@ -0,0 +1,92 @@
+from conftest import log_in, make_user
+from models import db, User, StatCounter
+from stats import UserStats
+
+
+def test_register_save_score_reconcile_round_trip(app):
+    user_stats = UserStats()
+
+    # Register, as in app.register
+    user = make_user('astronaut')
+    db.session.add(user)
+    user_stats.user_registered(user)
+    db.session.commit()
+
+    # Save a new high score, as in app.save_score
+    old_score, old_level = user.score, user.level
+    user.score = 300
+    user.level = 2
+    user_stats.score_changed(user, old_score, old_level)
+    db.session.commit()
+
+    assert user_stats.get() == {
+        'total_users': 2,
+        'active_users': 2,
+        'average_score': 175.0,
+        'max_score': 300,
+        'users_per_level': {1: 1, 2: 1},
+    }
+    assert user_stats.reconcile() == {}
+
+
+def test_deactivation_and_rollback(app):
+    user_stats = UserStats()
+    user = db.session.get(User, 1)
+
+    user_stats.set_active(user, False)
+    db.session.commit()
+    assert user_stats.get()['active_users'] == 0
+
+    user_stats.set_active(user, True)
+    db.session.rollback()
+    assert user_stats.get()['active_users'] == 0
+    assert user_stats.reconcile() == {}
+
+
+def test_reconcile_reports_and_fixes_drift(app):
+    user_stats = UserStats()
+    assert user_stats.get()['total_users'] == 1
+
+    db.session.get(StatCounter, 'total_users').value = 7
+    db.session.commit()
+
+    # Reconciliation from another process is picked up by this one
+    assert UserStats().reconcile() == {'total_users': (7, 1)}
+    user_stats._loaded_at = 0
+    assert user_stats.get()['total_users'] == 1
+
+
+def test_rolled_back_seed_is_redone(app):
+    user_stats = UserStats()
+    user = make_user('astronaut')
+    db.session.add(user)
+    user_stats.user_registered(user)
+    db.session.rollback()
+    assert StatCounter.query.count() == 0
+
+    user = make_user('astronaut')
+    db.session.add(user)
+    user_stats.user_registered(user)
+    db.session.commit()
+    assert user_stats.get()['total_users'] == 2
+    assert user_stats.reconcile() == {}
+
+
+def test_save_score_rejects_non_integer_level(client):
+    log_in(client)
+    for payload in ({'score': 600, 'level': 2.5}, {'score': '600', 'level': 2}, {'score': True, 'level': 2}):
+        response = client.post('/save_score', json=payload)
+        assert response.status_code == 400
+    assert StatCounter.query.filter(StatCounter.name.like('level:%')).count() == 0
+
+    assert client.post('/save_score', json={'score': 600, 'level': 2}).json['new_high_score']
+    assert client.get('/dashboard').status_code == 200
+
+
+def test_get_skips_unparseable_level_counters(app):
+    user_stats = UserStats()
+    user_stats.reconcile()
+    db.session.add(StatCounter(name='level:2.5', value=1))
+    db.session.commit()
+    user_stats._loaded_at = 0
+    assert user_stats.get()['users_per_level'] == {1: 1}